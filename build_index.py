@@ -0,0 +1,41 @@
+import pickle
+import os
+import numpy as np
+import streamlit as st
+from pymongo import MongoClient
+
+# Offline script: run `python build_index.py` to rebuild the PFAS zip code index.
+# The app loads this pickle at startup instead of querying MongoDB.
+PICKLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pfas_zips.pkl")
+
+# Fetch and clean the PFAS zip codes from a MongoDB collection
+def fetch_pfas_zipcodes(collection):
+    # Split, trim and deduplicate on the server so one document comes back
+    pipeline = [
+        {"$project": {"z": {"$cond": [
+            {"$isArray": "$ZIP Codes"},
+            "$ZIP Codes",
+            {"$split": [{"$toString": "$ZIP Codes"}, ";"]}
+        ]}}},
+        {"$unwind": "$z"},
+        {"$group": {"_id": None, "zips": {"$addToSet": {"$trim": {"input": {"$toString": "$z"}}}}}}
+    ]
+    doc = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+    if doc is None:
+        return np.empty(0, dtype=np.uint32)
+    
+    # Keep 5-digit codes only and pack them into a sorted uint32 array for binary search
+    zips = np.fromiter((int(z) for z in doc["zips"] if z and len(z) == 5 and z.isdigit()), dtype=np.uint32)
+    zips.sort()
+    return zips
+
+if __name__ == "__main__":
+    # Connection details come from the same .streamlit/secrets.toml as the app
+    client = MongoClient(st.secrets["mongodb_uri"])
+    collection = client[st.secrets["mongodb_db"]][st.secrets["mongodb_collection"]]
+    codes = fetch_pfas_zipcodes(collection)
+    client.close()
+    
+    with open(PICKLE_PATH, 'wb') as f:
+        pickle.dump(codes, f, protocol=5)
+    print(f"Wrote {len(codes)} unique PFAS zip codes to {PICKLE_PATH}")
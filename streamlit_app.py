@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from pymongo import MongoClient
-import base64
-import io
+import os
+import pickle
+from build_index import PICKLE_PATH, fetch_pfas_zipcodes
 
 # Set page configuration
 st.set_page_config(
@@ -41,10 +43,6 @@ st.markdown("""
 # Main title
 st.markdown('<p class="title">PFAS Zip Code Checker</p>', unsafe_allow_html=True)
 
-# Keep the PFAS zip code data in the session state to avoid reloading
-if 'pfas_zip_codes' not in st.session_state:
-    st.session_state.pfas_zip_codes = None
-
 # MongoDB Connection Details
 # Store these in Streamlit secrets in production
 # You can access them using st.secrets["mongo_uri"] etc.
@@ -52,68 +50,149 @@ mongodb_uri = st.secrets["mongodb_uri"]
 mongodb_db = st.secrets["mongodb_db"]
 mongodb_collection = st.secrets["mongodb_collection"]
 
+# Shared MongoDB client so the connection pool and TLS setup are reused
+@st.cache_resource
+def get_mongo_client():
+    return MongoClient(mongodb_uri, maxPoolSize=10, serverSelectionTimeoutMS=3000)
+
 # Function to load PFAS zip codes from MongoDB
-@st.cache_data(ttl=3600)  # Cache for 1 hour
+@st.cache_resource(ttl=86400)  # One sorted uint32 array shared across sessions, refreshed daily
 def load_pfas_zipcodes_from_mongodb():
-    try:
-        # Connect to MongoDB
-        client = MongoClient(mongodb_uri)
-        db = client[mongodb_db]
-        collection = db[mongodb_collection]
-        
-        # Fetch all records from the collection
-        records = list(collection.find({}, {"_id": 0}))
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(records)
-        
-        # Extract and clean zip codes
-        pfas_zip_codes = df['ZIP Codes']
-        pfas_zips_clean = set()
-        
-        for row in pfas_zip_codes:
-            if isinstance(row,list):
-                codes = [str(code).strip() for code in row if code]
-            else:
-                codes = [code.strip() for code in str(row).split(';')]
-            for code in codes:
-                if code and code != 'nan':
-                    pfas_zips_clean.add(code)
-        
-        return pfas_zips_clean
+    # Prefer the prebuilt index from build_index.py to skip the MongoDB round-trip
+    if os.path.exists(PICKLE_PATH):
+        try:
+            with open(PICKLE_PATH, 'rb') as f:
+                pfas_zips = pickle.load(f)
+            # Older pickles hold a frozenset; only a uint32 array is usable here
+            if isinstance(pfas_zips, np.ndarray) and pfas_zips.dtype == np.uint32:
+                return pfas_zips
+            st.warning(f'{PICKLE_PATH} is outdated, falling back to MongoDB. Rebuild it with build_index.py.')
+        except Exception as e:
+            st.warning(f'Could not read {PICKLE_PATH}, falling back to MongoDB: {e}')
     
-    except Exception as e:
-        st.error(f'Error loading PFAS zip codes from MongoDB: {e}')
-        return set()
+    # Connect to MongoDB; errors propagate so a failed load is not cached
+    client = get_mongo_client()
+    db = client[mongodb_db]
+    collection = db[mongodb_collection]
+    
+    return fetch_pfas_zipcodes(collection)
+
+# Check a batch of 5-digit zip codes against the PFAS index in one vectorized lookup
+def lookup_pfas_zips(zip_codes, pfas_zips):
+    values = np.array([int(zip_code) for zip_code in zip_codes], dtype=np.uint32)
+    return np.isin(values, pfas_zips)
 
 # Load PFAS zip codes
-if st.session_state.pfas_zip_codes is None:
-    st.session_state.pfas_zip_codes = load_pfas_zipcodes_from_mongodb()
-    if st.session_state.pfas_zip_codes:
-        st.markdown(f'<p>Database loaded with {len(st.session_state.pfas_zip_codes)} unique PFAS-affected zip codes.</p>', unsafe_allow_html=True)
+try:
+    pfas_zips = load_pfas_zipcodes_from_mongodb()
+except Exception as e:
+    st.error(f'Error loading PFAS zip codes from MongoDB: {e}')
+    pfas_zips = np.empty(0, dtype=np.uint32)
+
+if pfas_zips.size:
+    st.markdown(f'<p>Database loaded with {pfas_zips.size} unique PFAS-affected zip codes.</p>', unsafe_allow_html=True)
 
 # Create tabs for different functionalities
-tab1, tab2 = st.tabs(["Check Single Zip Code", "Why Check for PFAS?"])
+tab1, tab2 = st.tabs(["Check Zip Codes", "Why Check for PFAS?"])
 
-# Tab 1: Single Zip Code Check
+# Tab 1: Zip Code Check
 with tab1:
-    st.markdown('<p class="subtitle">Check a Single Zip Code</p>', unsafe_allow_html=True)
+    st.markdown('<p class="subtitle">Check One or More Zip Codes</p>', unsafe_allow_html=True)
     
     with st.form("zip_code_form"):
-        zip_code = st.text_input("Enter a 5-digit zip code:", max_chars=5)
-        check_button = st.form_submit_button("Check Zip Code")
+        raw_zip_codes = st.text_area("Enter one or more 5-digit zip codes, one per line or separated by commas:")
+        check_button = st.form_submit_button("Check Zip Codes")
         
         if check_button:
-            if not (len(zip_code) == 5 and zip_code.isdigit()):
-                st.error('Invalid zip code format. Please enter a 5-digit zip code.')
+            # Normalize pasted input such as " 10001 " or "1234" before validating
+            zip_codes, invalid_codes = [], []
+            for zip_code in raw_zip_codes.replace(',', '\n').splitlines():
+                zip_code = zip_code.strip()
+                if not zip_code:
+                    continue
+                if zip_code.isascii() and zip_code.isdigit() and len(zip_code) <= 5:
+                    zip_codes.append(zip_code.zfill(5))
+                else:
+                    invalid_codes.append(zip_code)
+            
+            if not pfas_zips.size:
+                st.error('The PFAS zip code database is unavailable right now. Please try again later.')
+            elif invalid_codes:
+                st.error(f'Invalid zip code format: {", ".join(invalid_codes)}. Please enter 5-digit zip codes.')
+            elif not zip_codes:
+                st.error('Please enter at least one 5-digit zip code.')
             else:
-                if zip_code in st.session_state.pfas_zip_codes:
-                    st.success(f'✅ Zip code {zip_code} is in a PFAS-affected area.')
+                hits = lookup_pfas_zips(zip_codes, pfas_zips)
+                if len(zip_codes) == 1:
+                    if hits[0]:
+                        st.success(f'✅ Zip code {zip_codes[0]} is in a PFAS-affected area.')
+                    else:
+                        st.warning(f"❌ Zip code {zip_codes[0]} is NOT in a PFAS-affected area.")
                 else:
-                    st.warning(f"❌ Zip code {zip_code} is NOT in a PFAS-affected area.")
+                    st.dataframe(pd.DataFrame({
+                        'Zip Code': zip_codes,
+                        'In_PFAS_Area': np.where(hits, 'Yes', 'No')
+                    }), hide_index=True)
 
 with tab2:
     st.markdown('<p class="subtitle">Potential Disabilities Caused by PFAS Exposure</p>', unsafe_allow_html=True)
+
+# # Imports used only by the file-processing tab below
+# import io
+# import pyarrow as pa
+# import pyarrow.compute as pc
+# import pyarrow.csv as pacsv
+
+# # Function to turn the uint32 PFAS index into the zero-padded strings add_pfas_status matches on
+# def build_pfas_value_set(pfas_zips):
+#     return pc.utf8_lpad(pc.cast(pa.array(pfas_zips), pa.string()), width=5, padding='0')
+
+# # Function to clean the zip column and flag rows in PFAS-affected areas
+# def add_pfas_status(df, zip_column, pfas_value_set):
+#     # Ensure zip codes are Arrow strings (missing values stay null)
+#     zips = pa.array(df[zip_column].astype('string[pyarrow]'))
+    
+#     # Handle zip codes that might have decimal points with Arrow compute kernels
+#     zips = pc.list_element(pc.split_pattern(zips, '.', max_splits=1), 0)
+#     zips = pc.utf8_lpad(zips, width=5, padding='0')
+#     df[zip_column] = pd.arrays.ArrowStringArray(zips)
+    
+#     # Add the PFAS status column with one vectorized lookup against the zero-padded index
+#     mask = np.asarray(pc.is_in(zips, value_set=pfas_value_set))
+#     df['In_PFAS_Area'] = pd.Categorical.from_codes(mask.astype(np.int8), categories=['No', 'Yes'])
+    
+#     # Return the frame and its PFAS count, summed straight off the boolean mask
+#     return df, int(mask.sum())
+
+# # Function to encode a results DataFrame as CSV bytes with Arrow's C++ writer
+# def to_csv_bytes(df):
+#     try:
+#         table = pa.Table.from_pandas(df, preserve_index=False)
+#     except (pa.ArrowInvalid, pa.ArrowTypeError):
+#         # Mixed-type object columns (common in Excel uploads) cannot become Arrow columns
+#         return df.to_csv(index=False).encode()
+#     # Decode the categorical status column, since the CSV writer expects plain strings
+#     status_idx = table.schema.get_field_index('In_PFAS_Area')
+#     table = table.set_column(status_idx, 'In_PFAS_Area', table.column(status_idx).cast(pa.string()))
+#     buf = io.BytesIO()
+#     pacsv.write_csv(table, buf)
+#     return buf.getvalue()
+
+# # Column names recognised as holding zip codes
+# POSSIBLE_ZIP_COLS = frozenset({'zip', 'zip_code', 'zipcode', 'postal_code', 'postal', 'zip code'})
+
+# # Function to parse an uploaded CSV or Excel file, cached by its name and contents
+# @st.cache_data(show_spinner=False, max_entries=4)
+# def parse_upload(name, data):
+#     if name.endswith('.csv'):
+#         # Multithreaded pyarrow parser, falling back to the more lenient C parser on input it rejects
+#         try:
+#             return pd.read_csv(io.BytesIO(data), engine='pyarrow', dtype_backend='pyarrow')
+#         except ValueError:  # includes pa.ArrowInvalid
+#             return pd.read_csv(io.BytesIO(data), engine='c', low_memory=False)
+#     else:
+#         return pd.read_excel(io.BytesIO(data), engine='calamine')
+
 # # Tab 2: Process Client File
 # with tab2:
 #     st.markdown('<p class="subtitle">Check Multiple Zip Codes</p>', unsafe_allow_html=True)
@@ -126,26 +205,31 @@ with tab2:
 #     if uploaded_file is not None:
 #         # Process the uploaded file
 #         try:
-#             # Determine file type and load accordingly
+#             # Large CSVs are streamed in chunks at processing time
+#             is_large_csv = uploaded_file.name.endswith('.csv') and uploaded_file.size > 10_000_000
+            
+#             # Only read the first rows for the preview; the full file is read on Process Data
+#             # (the pyarrow engine does not support nrows, so the preview uses the default parser)
 #             if uploaded_file.name.endswith('.csv'):
-#                 client_df = pd.read_csv(uploaded_file)
-#             elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-#                 client_df = pd.read_excel(uploaded_file)
+#                 preview_df = pd.read_csv(uploaded_file, nrows=100)
+#             else:
+#                 preview_df = pd.read_excel(uploaded_file, nrows=100, engine='calamine')
+#             uploaded_file.seek(0)
             
 #             # Display the first few rows of the file
 #             st.write("Preview of uploaded data:")
-#             st.dataframe(client_df.head())
+#             st.dataframe(preview_df)
             
 #             # Find the zip code column
-#             possible_zip_columns = ['zip', 'zip_code', 'zipcode', 'postal_code', 'postal', 'zip code']
-#             available_columns = client_df.columns.tolist()
+#             available_columns = preview_df.columns.tolist()
             
-#             # Try to find a match automatically
-#             zip_column = None
-#             for col in client_df.columns:
-#                 if col.lower() in possible_zip_columns:
-#                     zip_column = col
-#                     break
+#             # Try to find a match automatically, once per uploaded file
+#             zip_column_key = f"zip_column_{uploaded_file.file_id}"
+#             if zip_column_key not in st.session_state:
+#                 st.session_state[zip_column_key] = next(
+#                     (col for col in available_columns if str(col).lower() in POSSIBLE_ZIP_COLS), None
+#                 )
+#             zip_column = st.session_state[zip_column_key]
             
 #             # If not found automatically, let the user select
 #             if zip_column is None:
@@ -162,23 +246,28 @@ with tab2:
             
 #             process_button = st.button("Process Data")
             
-#             if process_button:
+#             if process_button and not pfas_zips.size:
+#                 st.error('The PFAS zip code database is unavailable right now. Please try again later.')
+#             elif process_button:
 #                 with st.spinner("Processing data..."):
-#                     # Ensure zip codes are treated as strings
-#                     client_df[zip_column] = client_df[zip_column].astype(str)
-                    
-#                     # Handle zip codes that might have decimal points
-#                     client_df[zip_column] = client_df[zip_column].apply(
-#                         lambda x: x.split('.')[0].zfill(5) if x and x != 'nan' else x
-#                     )
+#                     # Build the lookup set once rather than per chunk
+#                     pfas_value_set = build_pfas_value_set(pfas_zips)
                     
-#                     # Add the PFAS status column
-#                     client_df['In_PFAS_Area'] = client_df[zip_column].apply(
-#                         lambda x: 'Yes' if x in st.session_state.pfas_zip_codes else 'No'
-#                     )
+#                     if is_large_csv:
+#                         # Parse and flag in chunks so only one raw chunk is in flight at a time
+#                         uploaded_file.seek(0)
+#                         reader = pd.read_csv(uploaded_file, chunksize=100_000, dtype={zip_column: 'string'})
+#                         chunks, pfas_count = [], 0
+#                         for chunk in reader:
+#                             chunk, chunk_count = add_pfas_status(chunk, zip_column, pfas_value_set)
+#                             chunks.append(chunk)
+#                             pfas_count += chunk_count
+#                         client_df = pd.concat(chunks, ignore_index=True)
+#                     else:
+#                         client_df = parse_upload(uploaded_file.name, uploaded_file.getvalue())
+#                         client_df, pfas_count = add_pfas_status(client_df, zip_column, pfas_value_set)
                     
 #                     # Count results
-#                     pfas_count = client_df['In_PFAS_Area'].value_counts().get('Yes', 0)
 #                     total_count = len(client_df)
                     
 #                     # Create a results container
@@ -204,14 +293,13 @@ with tab2:
 #                         st.write("Results (with PFAS status):")
 #                         st.dataframe(client_df)
                         
-#                         # Create a download link for the results
-#                         csv_buffer = io.StringIO()
-#                         client_df.to_csv(csv_buffer, index=False)
-#                         csv_str = csv_buffer.getvalue()
-                        
-#                         b64 = base64.b64encode(csv_str.encode()).decode()
-#                         href = f'<a href="data:file/csv;base64,{b64}" download="{uploaded_file.name.split(".")[0]}_with_pfas_status.csv" class="success">Download Results as CSV</a>'
-#                         st.markdown(href, unsafe_allow_html=True)
+#                         # Serve the results as a download without inlining a base64 data URI
+#                         st.download_button(
+#                             label="Download Results as CSV",
+#                             data=to_csv_bytes(client_df),
+#                             file_name=f"{uploaded_file.name.rsplit('.', 1)[0]}_with_pfas_status.csv",
+#                             mime="text/csv"
+#                         )
                 
 #         except Exception as e:
 #             st.error(f"Error processing file: {e}")